@@ -1,16 +1,53 @@
+import asyncio
+import contextlib
+import functools
 import os
-import uuid
+import secrets
+from collections import OrderedDict, deque
 from io import BytesIO
-from typing import List, Dict, Any, Optional
+from pathlib import Path
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from PIL import Image
 
 from google import genai
 from google.genai import types
 
+
+# Large write buffer so PIL's many small chunk writes become few syscalls
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Image formats written to disk as-is, by MIME type; anything else is converted to PNG
+_IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+
+
+def _write_bytes(data: bytes, path: str) -> None:
+    """Write already-encoded image bytes to disk unchanged (blocking; run in a worker thread)."""
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def _save_png(data: bytes, path: str) -> None:
+    """Decode image bytes and save them as a PNG (blocking; run in a worker thread)."""
+    image = Image.open(BytesIO(data))
+    with open(path, "wb", buffering=_WRITE_BUFFER_SIZE) as fp:
+        image.save(fp, format="PNG", optimize=False)
+
+
+@functools.lru_cache(maxsize=8)
+def _chat_config(modalities: Tuple[str, ...] = ('Text', 'Image')) -> types.GenerateContentConfig:
+    """Build (once per modality set) the chat config shared by all conversations."""
+    return types.GenerateContentConfig(response_modalities=list(modalities))
+
+
 class GeminiClient:
     def __init__(self, api_key: str, model: str = "gemini-2.0-flash-exp-image-generation", 
-                 max_history: int = 30, output_dir: str = "output"):
+                 max_history: int = 30, output_dir: str = "output",
+                 max_conversations: int = 1000):
         """
         Initialize the Gemini client with support for multi-turn chatting and image generation.
         
@@ -19,13 +56,17 @@ class GeminiClient:
             model: The model name to use
             max_history: Maximum number of messages to keep in history (sliding window)
             output_dir: Directory to save generated images
+            max_conversations: Maximum number of conversations to keep; the least
+                recently active idle ones are evicted first
         """
         self.api_key = api_key
         self.model = model
         self.max_history = max_history
         self.output_dir = output_dir
+        self._output_path = Path(output_dir)
         self.client = genai.Client(api_key=api_key)
-        self.conversations = {}  # Store all active conversations
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()  # Active conversations, least recently active first
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -42,26 +83,36 @@ class GeminiClient:
         """
         # Generate ID if not provided
         if conversation_id is None:
-            conversation_id = str(uuid.uuid4())
+            conversation_id = secrets.token_urlsafe(16)
             
-        # Create chat config
-        config = types.GenerateContentConfig(
-            response_modalities=['Text', 'Image']
-        )
-        
-        # Create new chat session
-        chat = self.client.chats.create(
+        # Create new chat session (async API so sends don't block the event loop)
+        chat = self.client.aio.chats.create(
             model=self.model,
-            config=config
+            config=_chat_config()
         )
         
         # Store the conversation
         self.conversations[conversation_id] = {
             "chat": chat,
-            "history": [],
+            "history": deque(maxlen=self.max_history),  # sliding window
+            "lock": asyncio.Lock(),
             "created_at": datetime.now(),
             "last_active": datetime.now()
         }
+        self.conversations.move_to_end(conversation_id)
+        
+        # Evict the least recently active conversations past the cap. Conversations
+        # with a turn in flight are skipped, so the cap may be briefly exceeded.
+        excess = len(self.conversations) - self.max_conversations
+        if excess > 0:
+            idle_ids = []
+            for idle_id, idle in self.conversations.items():
+                if len(idle_ids) == excess:
+                    break
+                if idle_id != conversation_id and not idle["lock"].locked():
+                    idle_ids.append(idle_id)
+            for idle_id in idle_ids:
+                del self.conversations[idle_id]
         
         return conversation_id
     
@@ -73,7 +124,36 @@ class GeminiClient:
         """Get the message history for a conversation."""
         if conversation_id not in self.conversations:
             return []
-        return self.conversations[conversation_id]["history"]
+        self.conversations.move_to_end(conversation_id)
+        return list(self.conversations[conversation_id]["history"])
+    
+    @contextlib.asynccontextmanager
+    async def _locked_conversation(self, conversation_id: Optional[str]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Hold the lock of a conversation, creating the conversation if it doesn't exist.
+        
+        Yields:
+            The conversation ID and the conversation, which is still the stored one
+        """
+        while True:
+            # Check if conversation exists, create if not
+            if conversation_id not in self.conversations:
+                conversation_id = self.create_conversation(conversation_id)
+            else:
+                self.conversations.move_to_end(conversation_id)
+            
+            conversation = self.conversations[conversation_id]
+            await conversation["lock"].acquire()
+            
+            # A reset, delete or eviction may have replaced it while we waited
+            if self.conversations.get(conversation_id) is conversation:
+                break
+            conversation["lock"].release()
+        
+        try:
+            yield conversation_id, conversation
+        finally:
+            conversation["lock"].release()
     
     async def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
         """
@@ -86,91 +166,117 @@ class GeminiClient:
         Returns:
             A dictionary with the response information
         """
-        # Check if conversation exists, create if not
-        if conversation_id not in self.conversations:
-            conversation_id = self.create_conversation(conversation_id)
-        
-        conversation = self.conversations[conversation_id]
-        chat = conversation["chat"]
-        
-        # Record user message in history
-        user_message = {
-            "role": "user",
-            "content": message,
-            "timestamp": datetime.now().isoformat()
-        }
-        conversation["history"].append(user_message)
+        # Serialize turns within this conversation; other conversations proceed concurrently
+        async with self._locked_conversation(conversation_id) as (conversation_id, conversation):
+            chat = conversation["chat"]
+            
+            # Timestamp once per request and reuse it throughout; stored as a
+            # datetime and only formatted when a response is serialized
+            now = datetime.now()
         
-        # Process sliding window if needed
-        if len(conversation["history"]) > self.max_history:
-            # Keep the most recent messages
-            conversation["history"] = conversation["history"][-self.max_history:]
+            # Record user message in history
+            user_message = {
+                "role": "user",
+                "content": message,
+                "timestamp": now
+            }
+            conversation["history"].append(user_message)
         
-        # Update last active timestamp
-        conversation["last_active"] = datetime.now()
+            # Update last active timestamp
+            conversation["last_active"] = now
         
-        try:
-            # Send message to Gemini
-            response = chat.send_message(message)
-            
-            # Process response
-            text_content = response.text if hasattr(response, 'text') else None
-            image_paths = []
-            
-            # Extract and save any images
-            if hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and candidate.content is not None:
-                    if hasattr(candidate.content, 'parts'):
-                        for i, part in enumerate(candidate.content.parts):
-                            if hasattr(part, 'inline_data') and part.inline_data:
-                                # Generate unique filename
-                                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                                filename = f"{conversation_id}_{timestamp}_{i}.png"
-                                
-                                # Ensure output directory exists (redundant but safe)
-                                os.makedirs(self.output_dir, exist_ok=True)
-                                
-                                filepath = os.path.join(self.output_dir, filename)
-                                
-                                # Save the image
-                                image_data = part.inline_data.data
-                                image = Image.open(BytesIO(image_data))
-                                image.save(filepath)
-                                
-                                # Store the path
-                                image_paths.append(filepath)
-            
-            # Create assistant message for history
-            assistant_message = {
-                "role": "assistant",
-                "content": text_content,
-                "images": image_paths,
-                "timestamp": datetime.now().isoformat()
-            }
-            conversation["history"].append(assistant_message)
+            try:
+                # Send message to Gemini
+                response = await chat.send_message(message)
             
-            return {
-                "conversation_id": conversation_id,
-                "text": text_content,
-                "image_paths": image_paths,
-                "success": True
-            }
+                # Process response
+                text_content = getattr(response, 'text', None)
+                image_paths = []
+                image_names = []
+                save_tasks = []
             
-        except Exception as e:
-            # Log the error and add to history
-            error_message = {
-                "role": "system",
-                "content": f"Error: {str(e)}",
-                "timestamp": datetime.now().isoformat()
-            }
-            conversation["history"].append(error_message)
+                # All images in one response share a timestamp; the part index keeps names unique
+                timestamp = now.strftime("%Y%m%d%H%M%S")
             
-            return {
-                "conversation_id": conversation_id,
-                "error": str(e),
-                "success": False
-            }
+                # Walk candidates[0].content.parts once, tolerating any missing level
+                candidates = getattr(response, 'candidates', None)
+                content = getattr(candidates[0], 'content', None) if candidates else None
+                parts = getattr(content, 'parts', None) or ()
+            
+                # Extract and save any images
+                for i, part in enumerate(parts):
+                    inline_data = getattr(part, 'inline_data', None)
+                    if not inline_data:
+                        continue
+                    
+                    extension = _IMAGE_EXTENSIONS.get(inline_data.mime_type)
+                    
+                    # Generate unique filename
+                    filename = f"{conversation_id}_{timestamp}_{i}.{extension or 'png'}"
+                    filepath = str(self._output_path / filename)
+                    
+                    # Save the image off the event loop, skipping the PIL
+                    # decode/re-encode when the bytes are already servable
+                    save = _write_bytes if extension else _save_png
+                    save_tasks.append(asyncio.to_thread(save, inline_data.data, filepath))
+                    
+                    # Store the path, plus the name used to build its URL
+                    image_paths.append(filepath)
+                    image_names.append(filename)
+            
+                # Wait for all image saves to finish concurrently
+                if save_tasks:
+                    await asyncio.gather(*save_tasks)
+            
+                # Create assistant message for history
+                assistant_message = {
+                    "role": "assistant",
+                    "content": text_content,
+                    "images": image_names,  # file names in the output directory
+                    "timestamp": now
+                }
+                conversation["history"].append(assistant_message)
+            
+                return {
+                    "conversation_id": conversation_id,
+                    "text": text_content,
+                    "image_paths": image_paths,
+                    "image_names": image_names,
+                    "success": True
+                }
+            
+            except Exception as e:
+                # Log the error and add to history
+                error_message = {
+                    "role": "system",
+                    "content": f"Error: {str(e)}",
+                    "timestamp": now
+                }
+                conversation["history"].append(error_message)
+            
+                return {
+                    "conversation_id": conversation_id,
+                    "error": str(e),
+                    "success": False
+                }
+    
+    async def send_messages(self, messages: List[Tuple[Optional[str], str]]) -> List[Dict[str, Any]]:
+        """
+        Send several messages concurrently.
+        
+        Different conversations are sent in parallel so their round-trips overlap;
+        messages for the same conversation still go out in order, one turn at a time.
+        
+        Args:
+            messages: (conversation_id, message) pairs. A None ID starts a new conversation.
+            
+        Returns:
+            The send_message results, in the same order as the input
+        """
+        return await asyncio.gather(*(
+            self.send_message(conversation_id, message)
+            for conversation_id, message in messages
+        ))
     
     def reset_conversation(self, conversation_id: str) -> bool:
         """
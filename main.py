@@ -1,7 +1,7 @@
 import os
 from typing import Optional, List, Dict, Any
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -15,7 +15,8 @@ from gemini_client import GeminiClient
 
 # Initialize FastAPI app
 app = FastAPI(title="Gemini Chat API", 
-              description="API for interacting with Google's Gemini model with support for image generation")
+              description="API for interacting with Google's Gemini model with support for image generation",
+              default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -41,8 +42,8 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # Initialize the Gemini client
 gemini_client = GeminiClient(api_key=API_KEY, output_dir=OUTPUT_DIR)
 
-# Serve the output directory for image viewing
-app.mount("/images", StaticFiles(directory=OUTPUT_DIR), name="images")
+# Serve the output directory for image viewing (GET /images/{filename})
+app.mount("/images", StaticFiles(directory=OUTPUT_DIR, check_dir=False), name="images")
 
 # Pydantic models for request/response validation
 class MessageRequest(BaseModel):
@@ -60,29 +61,36 @@ class MessageResponse(BaseModel):
     success: bool
     error: Optional[str] = None
 
-# Helper function to convert file paths to URLs
+# Helper function to convert image file names to URLs
+def _with_image_urls(base_url: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Project a message with image file names into one carrying image URLs instead."""
+    projected = {key: value for key, value in message.items() if key != "images"}
+    projected["image_urls"] = [f"{base_url}/images/{name}" for name in message["images"]]
+    return projected
+
 def convert_paths_to_urls(base_url: str, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Convert image file paths in history to URLs."""
-    updated_history = []
+    """Convert image file names in history to URLs.
+
+    Messages that can't carry images are passed through as-is rather than copied.
+    """
+    return [
+        _with_image_urls(base_url, message) if "images" in message else message
+        for message in history
+    ]
+
+# Helper function to shape a send_message result for the API
+def to_message_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a client send result into a MessageResponse payload."""
+    # Build URLs from the file names recorded when the images were saved
+    image_urls = [f"/images/{name}" for name in response.get("image_names", [])]
     
-    for message in history:
-        message_copy = message.copy()
-        
-        # Convert image paths to URLs if they exist
-        if "images" in message_copy and message_copy["images"]:
-            image_urls = []
-            for img_path in message_copy["images"]:
-                if img_path:
-                    # Extract just the filename from the path
-                    filename = os.path.basename(img_path)
-                    image_urls.append(f"{base_url}/images/{filename}")
-            
-            message_copy["image_urls"] = image_urls
-            del message_copy["images"]  # Remove the original paths
-            
-        updated_history.append(message_copy)
-        
-    return updated_history
+    return {
+        "conversation_id": response["conversation_id"],
+        "text": response.get("text"),
+        "image_urls": image_urls,
+        "success": response.get("success", False),
+        "error": response.get("error")
+    }
 
 # API Endpoints
 @app.post("/chat", response_model=MessageResponse)
@@ -93,44 +101,45 @@ async def chat(request: MessageRequest):
         message=request.message
     )
     
-    # Convert file paths to URLs for the response
-    image_urls = []
-    for path in response.get("image_paths", []):
-        if path:
-            filename = os.path.basename(path)
-            image_urls.append(f"/images/{filename}")
+    return to_message_response(response)
+
+@app.post("/chat/batch", response_model=List[MessageResponse])
+async def chat_batch(requests: List[MessageRequest]):
+    """Send several messages at once; different conversations are processed concurrently."""
+    responses = await gemini_client.send_messages(
+        [(request.conversation_id, request.message) for request in requests]
+    )
     
-    return {
-        "conversation_id": response["conversation_id"],
-        "text": response.get("text"),
-        "image_urls": image_urls,
-        "success": response.get("success", False),
-        "error": response.get("error")
-    }
+    return [to_message_response(response) for response in responses]
 
+# Conversation endpoints run on the event loop (not the threadpool): they touch
+# the client's LRU and may create per-conversation asyncio locks.
 @app.get("/conversations", response_model=List[str])
-def list_conversations():
+async def list_conversations():
     """Get all active conversation IDs."""
     return gemini_client.get_conversation_ids()
 
-@app.get("/conversations/{conversation_id}", response_model=ConversationResponse)
-def get_conversation(conversation_id: str, base_url: str = Query("http://localhost:8000")):
+# History is already plain built-ins (orjson handles the datetimes), so skip
+# response-model validation; ConversationResponse still documents the schema.
+@app.get("/conversations/{conversation_id}", response_model=None,
+         responses={200: {"model": ConversationResponse}})
+async def get_conversation(conversation_id: str, base_url: str = Query("http://localhost:8000")):
     """Get the full history of a conversation with image URLs."""
     history = gemini_client.get_conversation_history(conversation_id)
     
     if not history:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Convert image paths to URLs
+    # Convert image file names to URLs
     updated_history = convert_paths_to_urls(base_url, history)
     
-    return {
+    return ORJSONResponse(content={
         "conversation_id": conversation_id,
         "history": updated_history
-    }
+    })
 
 @app.post("/conversations/{conversation_id}/reset")
-def reset_conversation(conversation_id: str):
+async def reset_conversation(conversation_id: str):
     """Reset a conversation, clearing its history."""
     success = gemini_client.reset_conversation(conversation_id)
     
@@ -140,7 +149,7 @@ def reset_conversation(conversation_id: str):
     return {"status": "success", "message": "Conversation reset"}
 
 @app.delete("/conversations/{conversation_id}")
-def delete_conversation(conversation_id: str):
+async def delete_conversation(conversation_id: str):
     """Delete a conversation completely."""
     success = gemini_client.delete_conversation(conversation_id)
     
@@ -149,16 +158,13 @@ def delete_conversation(conversation_id: str):
     
     return {"status": "success", "message": "Conversation deleted"}
 
-@app.get("/images/{filename}")
-def get_image(filename: str):
-    """Get a specific image by filename."""
-    file_path = os.path.join(OUTPUT_DIR, filename)
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-    
-    return FileResponse(file_path)
-
 # Main entry point
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    if os.environ.get("GEMINI_PRODUCTION", "").lower() in ("1", "true", "yes"):
+        # Conversations live in process memory, so each worker has its own set;
+        # use sticky sessions (or a shared store) when running more than one.
+        uvicorn.run("main:app", host="0.0.0.0", port=8000,
+                    workers=int(os.environ.get("GEMINI_WORKERS", os.cpu_count() or 1)),
+                    loop="uvloop", http="httptools")
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file